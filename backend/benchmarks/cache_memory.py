@@ -0,0 +1,98 @@
+"""
+Measure per-entry memory of the Spotify caches
+
+Compares the original layout (AudioFeatures.dict() and SongResponse.dict()
+entries with datetime timestamps in one dict) against AudioFeatureStore and
+TrackStore, filled with the same generated tracks.
+
+Usage: python benchmarks/cache_memory.py [count]
+"""
+import gc
+import random
+import string
+import sys
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from schemas import AudioFeatures, MoodEnum, SongResponse
+from services.compact_cache import AudioFeatureStore, TrackStore
+
+ID_CHARS = string.ascii_letters + string.digits
+ARTISTS = [f"Artist {i}" for i in range(2000)]
+ALBUMS = [f"Album {i}" for i in range(5000)]
+
+def make_track(rng: random.Random) -> SongResponse:
+    """Build a track with fresh ID, name and URL strings"""
+    track_id = "".join(rng.choices(ID_CHARS, k=22))
+    return SongResponse(
+        id=track_id,
+        name=f"Song {rng.randrange(10 ** 6)}",
+        artist=rng.choice(ARTISTS),
+        album=rng.choice(ALBUMS),
+        preview_url=f"https://p.scdn.co/mp3-preview/{rng.getrandbits(160):040x}",
+        external_url=f"https://open.spotify.com/track/{track_id}",
+        duration_ms=rng.randrange(120000, 300000),
+        audio_features=AudioFeatures(
+            tempo=rng.uniform(60, 180),
+            valence=rng.random(),
+            energy=rng.random(),
+            danceability=rng.random(),
+            instrumentalness=rng.random()
+        ),
+        predicted_mood=rng.choice(list(MoodEnum))
+    )
+
+def measure(fill, count: int) -> float:
+    """Return bytes per track still allocated once the inputs to fill() are dropped"""
+    rng = random.Random(0)
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    tracks = [make_track(rng) for _ in range(count)]
+    cache = fill(tracks)
+    del tracks
+    gc.collect()
+    retained = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del cache
+    return retained / count
+
+def dict_features(tracks):
+    return {
+        f"audio_features_{t.id}": {"data": t.audio_features.dict(), "timestamp": datetime.utcnow()}
+        for t in tracks
+    }
+
+def dict_tracks(tracks):
+    cache = dict_features(tracks)
+    for t in tracks:
+        cache[f"track_info_{t.id}"] = {"data": t.dict(), "timestamp": datetime.utcnow()}
+    return cache
+
+def store_features(tracks):
+    store = AudioFeatureStore(ttl=3600, max_size=len(tracks))
+    for t in tracks:
+        store.set(t.id, t.audio_features)
+    return store
+
+def store_tracks(tracks):
+    store = TrackStore(ttl=3600, max_size=len(tracks), audio_features=AudioFeatureStore(ttl=3600, max_size=len(tracks)))
+    for t in tracks:
+        store.set(t)
+    return store
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10 ** 5
+    rows = [
+        ("audio features", measure(dict_features, count), measure(store_features, count)),
+        ("track + features", measure(dict_tracks, count), measure(store_tracks, count))
+    ]
+    print(f"{count} tracks, bytes per entry")
+    print(f"{'':<18}{'dict':>8}{'store':>8}")
+    for name, before, after in rows:
+        print(f"{name:<18}{before:>8.0f}{after:>8.0f}")
+
+if __name__ == "__main__":
+    main()
@@ -18,6 +18,15 @@ class Settings(BaseSettings):
     SPOTIFY_CLIENT_SECRET: SecretStr
     SPOTIFY_REDIRECT_URI: HttpUrl
     
+    # Spotify Resilience Configuration
+    SPOTIFY_HEDGE_ENABLED: bool = True
+    SPOTIFY_HEDGE_MIN_DELAY: float = 0.05  # Lower bound on the p95-based hedge delay in seconds
+    SPOTIFY_HEDGE_BUDGET: float = 0.1  # Maximum fraction of calls that are hedged
+    SPOTIFY_MAX_WORKERS: int = 8  # Threads for blocking Spotify calls
+    SPOTIFY_BREAKER_FAILURE_THRESHOLD: int = 5  # Consecutive failures before failing fast
+    SPOTIFY_BREAKER_RESET_TIMEOUT: float = 30.0  # Seconds before a trial call is let through
+    SPOTIFY_REQUEST_TIMEOUT: float = 5.0  # Seconds per Spotify HTTP request; failed requests are not retried
+    
     # Model Configuration
     MODEL_PATH: str = "models/emotion_detection.tflite"
     CONFIDENCE_THRESHOLD: float = 0.7
@@ -32,6 +41,11 @@ class Settings(BaseSettings):
     CACHE_TTL: int = 3600  # 1 hour in seconds
     MAX_CACHE_SIZE: int = 1000
     
+    # Mood Session Configuration
+    MOOD_SMOOTHING_ALPHA: float = 0.3  # EMA weight given to each new frame
+    MOOD_HYSTERESIS_MARGIN: float = 0.15  # Score lead needed to leave the current mood
+    MOOD_MIN_DWELL_FRAMES: int = 3  # Consecutive frames a new mood must lead for
+    
     # Logging Configuration
     LOG_LEVEL: str = "INFO"
     LOG_FORMAT: str = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
@@ -40,6 +54,12 @@ class Settings(BaseSettings):
     API_KEY_NAME: str = "X-API-Key"
     API_KEY: Optional[SecretStr] = None
     
+    # Profiling Configuration
+    PROFILING_HEADER: str = "X-Profile"  # Enables profiling when sent with a valid API key
+    PROFILING_SAMPLE_RATE: float = 0.0  # Fraction of requests profiled without the header
+    PROFILING_BUFFER_SIZE: int = 100  # Slowest profiles kept for the slow request log
+    PROFILING_MAX_AGE: int = 3600  # Seconds a profile stays in the slow request log
+    
     class Config:
         case_sensitive = True
         env_file = ".env"
@@ -73,6 +93,15 @@ SPOTIFY_CLIENT_ID=your_client_id_here
 SPOTIFY_CLIENT_SECRET=your_client_secret_here
 SPOTIFY_REDIRECT_URI=http://localhost:8000/callback
 
+# Spotify Resilience Configuration
+SPOTIFY_HEDGE_ENABLED=True
+SPOTIFY_HEDGE_MIN_DELAY=0.05
+SPOTIFY_HEDGE_BUDGET=0.1
+SPOTIFY_MAX_WORKERS=8
+SPOTIFY_BREAKER_FAILURE_THRESHOLD=5
+SPOTIFY_BREAKER_RESET_TIMEOUT=30
+SPOTIFY_REQUEST_TIMEOUT=5
+
 # Model Configuration
 MODEL_PATH=models/emotion_detection.tflite
 CONFIDENCE_THRESHOLD=0.7
@@ -86,11 +115,21 @@ HOP_LENGTH=512
 CACHE_TTL=3600
 MAX_CACHE_SIZE=1000
 
+# Mood Session Configuration
+MOOD_SMOOTHING_ALPHA=0.3
+MOOD_HYSTERESIS_MARGIN=0.15
+MOOD_MIN_DWELL_FRAMES=3
+
 # Logging Configuration
 LOG_LEVEL=INFO
 
 # Security Configuration
 API_KEY=your_api_key_here
+
+# Profiling Configuration
+PROFILING_SAMPLE_RATE=0.0
+PROFILING_BUFFER_SIZE=100
+PROFILING_MAX_AGE=3600
 """
 
 # Create a sample .env file if it doesn't exist
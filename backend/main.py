@@ -1,14 +1,29 @@
-from fastapi import FastAPI, HTTPException, Request
+from fastapi import FastAPI, HTTPException, Request, WebSocket, WebSocketDisconnect, Depends
+from fastapi.security import APIKeyHeader
+from starlette.datastructures import Headers
+from fastapi.encoders import jsonable_encoder
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
+import json
 import logging
+import random
+import secrets
 from datetime import datetime
 from typing import Optional, List
 
 # Import our modules (will create these next)
-from schemas import SongAnalysisRequest, SongRecommendationRequest, SongResponse
+from pydantic import ValidationError
+
+from schemas import (
+    SongAnalysisRequest, SongRecommendationRequest, SongResponse,
+    MoodFrame, MoodSessionUpdate, RequestProfileResponse,
+    BulkTrackRequest, TrackLookupResult
+)
 from services.spotify_service import SpotifyService
+from services.mood_session import MoodSmoother
+from services.resilience import CircuitOpenError
 from config import Settings
+from profiling import SlowRequestLog, ProfilingMiddleware
 import utils
 
 # Initialize FastAPI app
@@ -39,6 +54,23 @@ logger = logging.getLogger(__name__)
 
 # Initialize services
 spotify_service = None
+slow_request_log = SlowRequestLog(
+    max_size=settings.PROFILING_BUFFER_SIZE,
+    max_age=settings.PROFILING_MAX_AGE
+)
+
+api_key_header = APIKeyHeader(name=settings.API_KEY_NAME, auto_error=False)
+
+def is_valid_api_key(api_key: Optional[str]) -> bool:
+    """Check an API key against the configured one"""
+    if not settings.API_KEY or not api_key:
+        return False
+    return secrets.compare_digest(api_key, settings.API_KEY.get_secret_value())
+
+async def verify_api_key(api_key: Optional[str] = Depends(api_key_header)):
+    """Require a valid API key"""
+    if not is_valid_api_key(api_key):
+        raise HTTPException(status_code=403, detail="Invalid or missing API key")
 
 @app.on_event("startup")
 async def startup_event():
@@ -60,6 +92,22 @@ async def log_requests(request: Request, call_next):
     )
     return response
 
+def should_profile(scope: dict) -> bool:
+    """Decide whether to profile a request: sampled, or opted in with a valid API key"""
+    # Health checks and admin endpoints would only crowd out the requests worth inspecting
+    if scope["path"] == "/health" or scope["path"].startswith("/admin/"):
+        return False
+    if settings.PROFILING_SAMPLE_RATE > 0 and random.random() < settings.PROFILING_SAMPLE_RATE:
+        return True
+    if not settings.API_KEY:
+        return False
+    headers = Headers(scope=scope)
+    return settings.PROFILING_HEADER in headers and is_valid_api_key(headers.get(settings.API_KEY_NAME))
+
+# Only installed when profiling can be enabled, so it adds nothing otherwise
+if settings.PROFILING_SAMPLE_RATE > 0 or settings.API_KEY:
+    app.add_middleware(ProfilingMiddleware, log=slow_request_log, should_profile=should_profile)
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
@@ -72,7 +120,11 @@ async def analyze_song(request: SongAnalysisRequest):
     """
     try:
         # Will implement the analysis logic in analysis.py
-        result = await utils.analyze_song_features(request.song_url)
+        result = await utils.analyze_song_features(
+            request.song_url,
+            sr=settings.SAMPLE_RATE,
+            max_size_mb=settings.MAX_AUDIO_SIZE_MB
+        )
         return result
     except Exception as e:
         logger.error(f"Error analyzing song: {str(e)}")
@@ -92,10 +144,100 @@ async def get_recommendations(request: SongRecommendationRequest):
             limit=request.limit or 10
         )
         return recommendations
+    except HTTPException:
+        raise
+    except CircuitOpenError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         logger.error(f"Error getting recommendations: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/tracks", response_model=List[TrackLookupResult])
+async def get_tracks(request: BulkTrackRequest):
+    """
+    Look up many tracks at once, in request order
+    """
+    try:
+        if not spotify_service:
+            raise HTTPException(status_code=503, detail="Spotify service not initialized")
+        
+        tracks = await spotify_service.get_tracks_info(request.track_ids)
+        return [
+            TrackLookupResult(id=track_id, found=track is not None, track=track)
+            for track_id, track in zip(request.track_ids, tracks)
+        ]
+    except HTTPException:
+        raise
+    except CircuitOpenError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error getting tracks: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.websocket("/ws/mood_session")
+async def mood_session(websocket: WebSocket, limit: int = 10):
+    """
+    Stream detection frames and receive recommendations on mood change
+    Each incoming message is a MoodFrame; a MoodSessionUpdate is pushed
+    only when the smoothed mood changes
+    """
+    await websocket.accept()
+    if not spotify_service:
+        await websocket.send_json({"detail": "Spotify service not initialized"})
+        await websocket.close(code=1011)
+        return
+
+    limit = min(max(limit, 1), 50)
+    smoother = MoodSmoother.from_settings(settings)
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(message.get("code", 1000))
+            try:
+                if message.get("text") is None:
+                    raise ValueError("expected a JSON text frame")
+                frame = MoodFrame(**json.loads(message["text"]))
+                mood = smoother.update(frame)
+            except (ValidationError, ValueError, TypeError) as e:
+                await websocket.send_json({"detail": f"Invalid frame: {str(e)}"})
+                continue
+
+            if mood is None:
+                continue
+
+            try:
+                recommendations = await spotify_service.get_recommendations(mood=mood, limit=limit)
+            except Exception as e:
+                logger.error(f"Error getting recommendations for mood session: {str(e)}")
+                await websocket.send_json({"detail": str(e)})
+                continue
+
+            update = MoodSessionUpdate(mood=mood, recommendations=recommendations)
+            await websocket.send_json(jsonable_encoder(update))
+    except WebSocketDisconnect:
+        logger.info("Mood session disconnected")
+
+@app.get(
+    "/admin/slow_requests",
+    response_model=List[RequestProfileResponse],
+    dependencies=[Depends(verify_api_key)]
+)
+async def get_slow_requests(limit: int = 10):
+    """
+    Get the slowest recently profiled requests
+    """
+    return slow_request_log.slowest(limit=limit)
+
+@app.get("/admin/metrics", dependencies=[Depends(verify_api_key)])
+async def get_metrics():
+    """
+    Get circuit breaker state and hedge counts for Spotify endpoints
+    """
+    if not spotify_service:
+        raise HTTPException(status_code=503, detail="Spotify service not initialized")
+    return {"spotify": spotify_service.get_metrics()}
+
 @app.exception_handler(HTTPException)
 async def http_exception_handler(request: Request, exc: HTTPException):
     """Custom exception handler for HTTP exceptions"""
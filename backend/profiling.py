@@ -0,0 +1,148 @@
+import heapq
+import itertools
+import time
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Profile of the request being handled, None when profiling is off
+_current_profile: ContextVar[Optional["RequestProfile"]] = ContextVar("current_profile", default=None)
+
+_profile_ids = itertools.count(1)
+
+class RequestProfile:
+    """Span timeline captured for a single request"""
+
+    __slots__ = ("id", "method", "path", "status_code", "started_at", "start", "duration", "spans", "_token")
+
+    def __init__(self, method: str, path: str):
+        self.id = next(_profile_ids)
+        self.method = method
+        self.path = path
+        self.status_code: Optional[int] = None
+        self.started_at = datetime.utcnow()
+        self.start = time.perf_counter()
+        self.duration = 0.0
+        self.spans: List[tuple] = []
+        self._token = None
+
+    def to_dict(self) -> dict:
+        """Return the profile as a JSON-serializable dictionary"""
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "status_code": self.status_code,
+            "started_at": self.started_at,
+            "duration_ms": self.duration * 1000,
+            "spans": [
+                {
+                    "name": name,
+                    "start_ms": (start - self.start) * 1000,
+                    "duration_ms": (end - start) * 1000
+                }
+                for name, start, end in self.spans
+            ]
+        }
+
+class span:
+    """
+    Context manager recording a named span on the current request profile
+    When no profile is active it only performs a single context variable lookup
+    """
+
+    __slots__ = ("name", "profile", "start")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.profile = _current_profile.get()
+        if self.profile is not None:
+            self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.profile is not None:
+            self.profile.spans.append((self.name, self.start, time.perf_counter()))
+        return False
+
+def start_profile(method: str, path: str) -> RequestProfile:
+    """Start profiling the current request"""
+    profile = RequestProfile(method, path)
+    profile._token = _current_profile.set(profile)
+    return profile
+
+def finish_profile(profile: RequestProfile, status_code: int):
+    """Stop profiling the current request"""
+    profile.status_code = status_code
+    profile.duration = time.perf_counter() - profile.start
+    _current_profile.reset(profile._token)
+
+class SlowRequestLog:
+    """
+    Keeps the slowest recent request profiles
+    Profiles are held in a bounded min-heap keyed on duration, so a faster
+    profile never displaces a slower one; profiles older than max_age
+    seconds are dropped
+    """
+
+    def __init__(self, max_size: int = 100, max_age: Optional[float] = None):
+        self.max_size = max_size
+        self.max_age = max_age
+        self.profiles: List[Tuple[float, int, RequestProfile]] = []
+
+    def _prune(self):
+        """Drop profiles older than max_age"""
+        if self.max_age is None:
+            return
+        cutoff = time.perf_counter() - self.max_age
+        if any(profile.start < cutoff for _, _, profile in self.profiles):
+            self.profiles = [item for item in self.profiles if item[2].start >= cutoff]
+            heapq.heapify(self.profiles)
+
+    def record(self, profile: RequestProfile):
+        """Add a finished profile if it is among the slowest"""
+        self._prune()
+        item = (profile.duration, profile.id, profile)
+        if len(self.profiles) < self.max_size:
+            heapq.heappush(self.profiles, item)
+        elif self.profiles and item > self.profiles[0]:
+            heapq.heapreplace(self.profiles, item)
+
+    def slowest(self, limit: int = 10) -> List[Dict]:
+        """Return the slowest recent profiles, slowest first"""
+        self._prune()
+        return [profile.to_dict() for _, _, profile in heapq.nlargest(limit, self.profiles)]
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware capturing a span timeline for selected HTTP requests
+    Requests that are not selected are passed straight to the app
+    """
+
+    def __init__(self, app, log: SlowRequestLog, should_profile: Callable[[dict], bool]):
+        self.app = app
+        self.log = log
+        self.should_profile = should_profile
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.should_profile(scope):
+            return await self.app(scope, receive, send)
+
+        profile = start_profile(scope["method"], scope["path"])
+        status_code = 500
+
+        async def send_with_profile_id(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                headers = list(message.get("headers", [])) + [(b"x-profile-id", str(profile.id).encode())]
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            finish_profile(profile, status_code)
+            self.log.record(profile)
@@ -1,6 +1,7 @@
 from pydantic import BaseModel, HttpUrl, Field
-from typing import Optional, List
+from typing import Optional, List, Dict
 from enum import Enum
+from datetime import datetime
 
 class MoodEnum(str, Enum):
     """Enumeration of possible mood categories"""
@@ -80,6 +81,64 @@ class SongResponse(BaseModel):
             }
         }
 
+class BulkTrackRequest(BaseModel):
+    """Request model for bulk track lookup"""
+    track_ids: List[str] = Field(..., min_items=1, max_items=1000, description="Spotify track IDs to look up")
+
+    class Config:
+        schema_extra = {
+            "example": {
+                "track_ids": ["4uLU6hMCjMI75M1A2tKUQC", "7GhIk7Il098yCjg4BQjzvb"]
+            }
+        }
+
+class TrackLookupResult(BaseModel):
+    """Result of looking up a single track"""
+    id: str = Field(..., description="Requested track ID")
+    found: bool = Field(..., description="Whether the track was found")
+    track: Optional[SongResponse] = Field(None, description="Track data if found")
+
+class MoodFrame(BaseModel):
+    """A single detection frame sent over a mood session"""
+    scores: Optional[Dict[MoodEnum, float]] = Field(None, description="Per-mood scores for this frame")
+    mood: Optional[MoodEnum] = Field(None, description="Predicted mood for this frame")
+    confidence: Optional[float] = Field(1.0, ge=0, le=1, description="Confidence of the predicted mood")
+
+    class Config:
+        schema_extra = {
+            "example": {
+                "scores": {
+                    "happy": 0.7,
+                    "sad": 0.05,
+                    "energetic": 0.1,
+                    "calm": 0.05,
+                    "angry": 0.0,
+                    "neutral": 0.1
+                }
+            }
+        }
+
+class MoodSessionUpdate(BaseModel):
+    """Message pushed to a mood session when the smoothed mood changes"""
+    mood: MoodEnum = Field(..., description="Smoothed mood of the session")
+    recommendations: List[SongResponse] = Field(..., description="Recommendations for the new mood")
+
+class ProfileSpan(BaseModel):
+    """Timed span within a profiled request"""
+    name: str = Field(..., description="Span name")
+    start_ms: float = Field(..., description="Offset from the start of the request in milliseconds")
+    duration_ms: float = Field(..., description="Span duration in milliseconds")
+
+class RequestProfileResponse(BaseModel):
+    """Span timeline captured for a profiled request"""
+    id: int = Field(..., description="Profile ID")
+    method: str = Field(..., description="HTTP method")
+    path: str = Field(..., description="Request path")
+    status_code: Optional[int] = Field(None, description="Response status code")
+    started_at: datetime = Field(..., description="Time the request started")
+    duration_ms: float = Field(..., description="Total request duration in milliseconds")
+    spans: List[ProfileSpan] = Field(..., description="Spans recorded during the request")
+
 class ErrorResponse(BaseModel):
     """Model for error responses"""
     detail: str = Field(..., description="Error description")
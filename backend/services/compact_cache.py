@@ -0,0 +1,220 @@
+import heapq
+import sys
+import time
+from typing import Container, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from schemas import AudioFeatures, MoodEnum, SongResponse
+
+AUDIO_FEATURE_FIELDS = ("tempo", "valence", "energy", "danceability", "instrumentalness")
+
+# External URLs of this form are rebuilt from the track ID instead of stored
+SPOTIFY_TRACK_URL = "https://open.spotify.com/track/{}"
+
+# Fraction of entries evicted at once when a store is full, so eviction cost is amortized
+EVICTION_FRACTION = 0.1
+
+class AudioFeatureStore:
+    """
+    Compact TTL cache of audio features keyed by track ID
+
+    Features are packed as float32 rows in a growable array, with timestamps
+    as monotonic floats in a parallel array. At 10^5 tracks each entry
+    retains 186 bytes (the 22 character track ID string and its index slot,
+    a 20 byte row, an 8 byte timestamp and a row-to-ID pointer, plus spare
+    capacity) against 653 bytes for a dict wrapping AudioFeatures.dict() and
+    a datetime; see benchmarks/cache_memory.py. Values are stored as float32
+    and read back rounded to 7 significant digits.
+
+    When full, the oldest entries whose IDs are not in pinned are evicted
+    first, so a TrackStore can keep the rows its records still need.
+    """
+
+    def __init__(self, ttl: float, max_size: int, initial_capacity: int = 1024):
+        self.ttl = ttl
+        self.max_size = max_size
+        capacity = max(min(initial_capacity, max_size), 1)
+        self._rows = np.zeros((capacity, len(AUDIO_FEATURE_FIELDS)), dtype=np.float32)
+        self._timestamps = np.zeros(capacity, dtype=np.float64)
+        self._ids: List[Optional[str]] = [None] * capacity
+        self._index: Dict[str, int] = {}
+        self._free: List[int] = []
+        self._used = 0
+        self.pinned: Container[str] = ()
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def _allocate(self) -> int:
+        """Return a free row, growing the arrays if needed"""
+        if self._free:
+            return self._free.pop()
+        if self._used == len(self._rows):
+            capacity = min(len(self._rows) * 2, max(self.max_size, 1))
+            self._rows = np.resize(self._rows, (capacity, len(AUDIO_FEATURE_FIELDS)))
+            self._timestamps = np.resize(self._timestamps, capacity)
+            self._ids.extend([None] * (capacity - len(self._ids)))
+        row = self._used
+        self._used += 1
+        return row
+
+    def _remove(self, track_id: str):
+        """Remove an entry and free its row"""
+        row = self._index.pop(track_id)
+        self._ids[row] = None
+        self._free.append(row)
+
+    def _evict(self, now: float):
+        """Remove expired entries, then the oldest unpinned entries if still full"""
+        rows = np.fromiter(self._index.values(), dtype=np.int64, count=len(self._index))
+        ages = now - self._timestamps[rows]
+        expired = rows[ages > self.ttl]
+        if len(self._index) - len(expired) >= self.max_size:
+            unpinned = np.fromiter(
+                (track_id not in self.pinned for track_id in self._index),
+                dtype=bool,
+                count=len(self._index)
+            )
+            if unpinned.any():
+                rows, ages = rows[unpinned], ages[unpinned]
+            count = min(max(int(self.max_size * EVICTION_FRACTION), 1), len(rows))
+            expired = np.union1d(expired, rows[np.argpartition(-ages, count - 1)[:count]])
+        for row in expired.tolist():
+            self._remove(self._ids[row])
+
+    def find(self, ranges: Dict[str, Tuple[float, float]]) -> List[str]:
+        """Return IDs of unexpired tracks whose features fall within the given ranges"""
+        rows = np.fromiter(self._index.values(), dtype=np.int64, count=len(self._index))
+        mask = time.monotonic() - self._timestamps[rows] <= self.ttl
+        for field, (min_val, max_val) in ranges.items():
+            values = self._rows[rows, AUDIO_FEATURE_FIELDS.index(field)]
+            mask &= (values >= min_val) & (values <= max_val)
+        return [self._ids[row] for row in rows[mask].tolist()]
+
+    def get(self, track_id: str) -> Optional[AudioFeatures]:
+        """Get audio features if cached and not expired"""
+        row = self._index.get(track_id)
+        if row is None:
+            return None
+        if time.monotonic() - self._timestamps[row] > self.ttl:
+            self._remove(track_id)
+            return None
+        # Round to float32 precision so values read back as they were written
+        values = [float(f"{value:.7g}") for value in self._rows[row].tolist()]
+        return AudioFeatures(**dict(zip(AUDIO_FEATURE_FIELDS, values)))
+
+    def set(self, track_id: str, features: AudioFeatures):
+        """Cache audio features for a track"""
+        now = time.monotonic()
+        row = self._index.get(track_id)
+        if row is None:
+            if len(self._index) >= self.max_size:
+                self._evict(now)
+            row = self._allocate()
+            self._index[track_id] = row
+            self._ids[row] = track_id
+        self._rows[row] = [getattr(features, field) for field in AUDIO_FEATURE_FIELDS]
+        self._timestamps[row] = now
+
+class TrackRecord:
+    """Cached track metadata"""
+
+    __slots__ = ("name", "artist", "album", "preview_url", "external_url", "duration_ms", "predicted_mood", "timestamp")
+
+    def __init__(
+        self,
+        name: str,
+        artist: str,
+        album: str,
+        preview_url: Optional[str],
+        external_url: Optional[str],
+        duration_ms: int,
+        predicted_mood: Optional[MoodEnum],
+        timestamp: float
+    ):
+        self.name = name
+        self.artist = artist
+        self.album = album
+        self.preview_url = preview_url
+        self.external_url = external_url
+        self.duration_ms = duration_ms
+        self.predicted_mood = predicted_mood
+        self.timestamp = timestamp
+
+class TrackStore:
+    """
+    Compact TTL cache of track metadata keyed by track ID
+
+    Tracks are kept as __slots__ records with interned artist and album names
+    and plain string URLs, omitting the external URL when it is the standard
+    Spotify track URL; audio features are read from an AudioFeatureStore,
+    and a track whose features have expired is treated as a miss. At 10^5
+    tracks a track and its features retain 565 bytes, mostly the ID, name
+    and preview URL strings, against 2655 bytes for the track_info and
+    audio_features dict entries they replace; see benchmarks/cache_memory.py.
+
+    The feature store may be shared with other users, such as recommendation
+    lookups, so cached tracks pin their feature rows against size-based
+    eviction. The feature store should be sized above max_size so that
+    unpinned rows remain to evict.
+    """
+
+    def __init__(self, ttl: float, max_size: int, audio_features: AudioFeatureStore):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.audio_features = audio_features
+        self._records: Dict[str, TrackRecord] = {}
+        audio_features.pinned = self._records
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def _evict(self, now: float):
+        """Remove expired entries, then the oldest entries if still full"""
+        expired = [k for k, v in self._records.items() if now - v.timestamp > self.ttl]
+        if len(self._records) - len(expired) >= self.max_size:
+            count = max(int(self.max_size * EVICTION_FRACTION), 1)
+            expired = heapq.nsmallest(count, self._records, key=lambda k: self._records[k].timestamp)
+        for k in expired:
+            del self._records[k]
+
+    def get(self, track_id: str) -> Optional[SongResponse]:
+        """Get a track if cached and not expired"""
+        record = self._records.get(track_id)
+        if record is None:
+            return None
+        features = self.audio_features.get(track_id)
+        if time.monotonic() - record.timestamp > self.ttl or features is None:
+            del self._records[track_id]
+            return None
+        return SongResponse(
+            id=track_id,
+            name=record.name,
+            artist=record.artist,
+            album=record.album,
+            preview_url=record.preview_url,
+            external_url=record.external_url or SPOTIFY_TRACK_URL.format(track_id),
+            duration_ms=record.duration_ms,
+            audio_features=features,
+            predicted_mood=record.predicted_mood
+        )
+
+    def set(self, song: SongResponse):
+        """Cache a track along with its audio features"""
+        now = time.monotonic()
+        if song.id not in self._records and len(self._records) >= self.max_size:
+            self._evict(now)
+        if song.audio_features:
+            self.audio_features.set(song.id, song.audio_features)
+        external_url = str(song.external_url)
+        self._records[song.id] = TrackRecord(
+            name=song.name,
+            artist=sys.intern(song.artist),
+            album=sys.intern(song.album),
+            preview_url=str(song.preview_url) if song.preview_url else None,
+            external_url=None if external_url == SPOTIFY_TRACK_URL.format(song.id) else external_url,
+            duration_ms=song.duration_ms,
+            predicted_mood=song.predicted_mood,
+            timestamp=now
+        )
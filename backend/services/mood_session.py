@@ -0,0 +1,79 @@
+import logging
+from typing import Dict, Optional
+
+from schemas import MoodEnum, MoodFrame
+from config import Settings
+
+logger = logging.getLogger(__name__)
+
+class MoodSmoother:
+    """
+    Temporal smoothing with hysteresis over a stream of detection frames
+    Scores are averaged with an exponential moving average, and the session
+    mood only switches once another mood leads the current one by a margin
+    for a minimum number of consecutive frames
+    """
+
+    def __init__(self, alpha: float = 0.3, margin: float = 0.15, min_dwell_frames: int = 3):
+        self.alpha = alpha
+        self.margin = margin
+        self.min_dwell_frames = max(min_dwell_frames, 1)
+        self.scores: Dict[MoodEnum, float] = {}
+        self.current: Optional[MoodEnum] = None
+        self._candidate: Optional[MoodEnum] = None
+        self._candidate_frames = 0
+
+    @classmethod
+    def from_settings(cls, settings: Settings) -> "MoodSmoother":
+        """Create a smoother using the mood session settings"""
+        return cls(
+            alpha=settings.MOOD_SMOOTHING_ALPHA,
+            margin=settings.MOOD_HYSTERESIS_MARGIN,
+            min_dwell_frames=settings.MOOD_MIN_DWELL_FRAMES
+        )
+
+    @staticmethod
+    def frame_scores(frame: MoodFrame) -> Dict[MoodEnum, float]:
+        """Convert a frame to per-mood scores"""
+        if frame.scores:
+            return {mood: max(float(frame.scores.get(mood, 0.0)), 0.0) for mood in MoodEnum}
+        if frame.mood:
+            confidence = frame.confidence if frame.confidence is not None else 1.0
+            return {mood: (confidence if mood == frame.mood else 0.0) for mood in MoodEnum}
+        raise ValueError("Frame must contain either scores or mood")
+
+    def update(self, frame: MoodFrame) -> Optional[MoodEnum]:
+        """
+        Feed one frame into the smoother
+        Returns the new mood if the smoothed mood changed, None otherwise
+        """
+        scores = self.frame_scores(frame)
+
+        # The first frame seeds the average and sets the initial mood
+        if self.current is None:
+            self.scores = scores
+            self.current = max(self.scores, key=self.scores.get)
+            return self.current
+
+        for mood in MoodEnum:
+            self.scores[mood] = (1 - self.alpha) * self.scores[mood] + self.alpha * scores[mood]
+
+        leader = max(self.scores, key=self.scores.get)
+        if leader == self.current or self.scores[leader] - self.scores[self.current] < self.margin:
+            self._candidate = None
+            self._candidate_frames = 0
+            return None
+
+        if leader != self._candidate:
+            self._candidate = leader
+            self._candidate_frames = 0
+        self._candidate_frames += 1
+
+        if self._candidate_frames < self.min_dwell_frames:
+            return None
+
+        logger.debug(f"Mood session switched from {self.current} to {leader}")
+        self.current = leader
+        self._candidate = None
+        self._candidate_frames = 0
+        return self.current
@@ -0,0 +1,213 @@
+import asyncio
+import functools
+import logging
+import time
+from collections import deque
+from concurrent.futures import Executor
+from typing import Callable, Deque, Optional
+
+logger = logging.getLogger(__name__)
+
+class CircuitOpenError(Exception):
+    """Raised when a call is rejected because the circuit breaker is open"""
+
+    def __init__(self, endpoint: str):
+        super().__init__(f"Circuit breaker open for {endpoint}")
+        self.endpoint = endpoint
+
+class CircuitBreaker:
+    """
+    Circuit breaker that opens after consecutive failures
+    Once open, calls fail fast until reset_timeout has passed; then a single
+    trial call is let through, closing the breaker on success
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_count = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+
+    def allow(self) -> bool:
+        """Return whether a call may proceed"""
+        if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self.state = self.HALF_OPEN
+            self._trial_in_flight = False
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.HALF_OPEN and not self._trial_in_flight:
+            self._trial_in_flight = True
+            return True
+        return False
+
+    def record_success(self):
+        """Close the breaker after a successful call"""
+        self.state = self.CLOSED
+        self.failures = 0
+        self._trial_in_flight = False
+
+    def record_failure(self):
+        """Count a failed call, opening the breaker at the threshold"""
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                self.opened_count += 1
+            self.state = self.OPEN
+            self._opened_at = time.monotonic()
+            self._trial_in_flight = False
+
+    def release(self):
+        """
+        Give up a call that ended without an outcome, such as a cancelled one
+        A cancelled trial call reopens the breaker so that a later trial can run
+        """
+        if self.state == self.HALF_OPEN and self._trial_in_flight:
+            self.state = self.OPEN
+            self._opened_at = time.monotonic()
+            self._trial_in_flight = False
+
+def is_service_failure(error: Exception) -> bool:
+    """
+    Check whether an error indicates the remote service is unhealthy
+    Client errors such as an unknown track ID do not count against the breaker
+    """
+    status = getattr(error, "http_status", None)
+    return status is None or status >= 500 or status == 429
+
+class ResilientEndpoint:
+    """
+    Runs blocking calls to one remote endpoint with hedging and a circuit breaker
+
+    Calls run in the given executor, or the default one. Once enough latencies
+    of hedged calls have been observed, a hedged call that has not returned
+    within their recent p95 latency is duplicated, and whichever attempt
+    succeeds first is used. Latency is measured inside the worker thread, so
+    it excludes time spent queued. Hedges are limited to hedge_budget of
+    calls, so a degraded upstream does not see its load doubled.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0,
+        hedge_enabled: bool = True,
+        hedge_min_delay: float = 0.05,
+        hedge_min_samples: int = 20,
+        hedge_budget: float = 0.1,
+        latency_window: int = 200,
+        executor: Optional[Executor] = None
+    ):
+        self.name = name
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.hedge_enabled = hedge_enabled
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_min_samples = hedge_min_samples
+        self.hedge_budget = hedge_budget
+        self.executor = executor
+        self.latencies: Deque[float] = deque(maxlen=latency_window)
+        # Earned at hedge_budget per hedged call and spent one per hedge
+        self._hedge_tokens = 0.0
+        self.calls = 0
+        self.failures = 0
+        self.rejected = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def hedge_delay(self) -> Optional[float]:
+        """Return the p95 latency to wait before hedging, None if unknown"""
+        if len(self.latencies) < self.hedge_min_samples:
+            return None
+        latencies = sorted(self.latencies)
+        p95 = latencies[min(int(len(latencies) * 0.95), len(latencies) - 1)]
+        return max(p95, self.hedge_min_delay)
+
+    def _start_attempt(self, fn: Callable, record_latency: bool) -> asyncio.Future:
+        """Run one attempt in the executor, recording its latency on success"""
+        def timed():
+            start = time.monotonic()
+            result = fn()
+            if record_latency:
+                self.latencies.append(time.monotonic() - start)
+            return result
+
+        return asyncio.get_event_loop().run_in_executor(self.executor, timed)
+
+    async def _run(self, fn: Callable, hedge: bool):
+        """Run a call, hedging it if it is slower than the recent p95"""
+        primary = self._start_attempt(fn, hedge)
+        delay = self.hedge_delay() if hedge and self.hedge_enabled else None
+        if delay is None:
+            return await primary
+
+        self._hedge_tokens = min(self._hedge_tokens + self.hedge_budget, 1.0)
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        if done:
+            return primary.result()
+        if self._hedge_tokens < 1.0:
+            return await primary
+
+        self._hedge_tokens -= 1.0
+        self.hedges += 1
+        secondary = self._start_attempt(fn, hedge)
+        pending = {primary, secondary}
+        error = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is secondary:
+                        self.hedge_wins += 1
+                    # The losing attempt keeps running in its thread; its result is dropped
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    async def call(self, fn: Callable, *args, hedge: bool = False, **kwargs):
+        """
+        Call fn(*args, **kwargs) through the circuit breaker
+        Only pass hedge=True for idempotent calls of similar cost, as they
+        share one latency window
+        """
+        if not self.breaker.allow():
+            self.rejected += 1
+            raise CircuitOpenError(self.name)
+
+        self.calls += 1
+        try:
+            result = await self._run(functools.partial(fn, *args, **kwargs), hedge)
+        except asyncio.CancelledError:
+            self.breaker.release()
+            raise
+        except Exception as e:
+            if is_service_failure(e):
+                self.failures += 1
+                self.breaker.record_failure()
+                if self.breaker.state == CircuitBreaker.OPEN:
+                    logger.warning(f"Circuit breaker open for {self.name}: {str(e)}")
+            else:
+                self.breaker.record_success()
+            raise
+        self.breaker.record_success()
+        return result
+
+    def metrics(self) -> dict:
+        """Return breaker state and call counters"""
+        return {
+            "state": self.breaker.state,
+            "consecutive_failures": self.breaker.failures,
+            "opened_count": self.breaker.opened_count,
+            "calls": self.calls,
+            "failures": self.failures,
+            "rejected": self.rejected,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "hedge_delay": self.hedge_delay()
+        }
@@ -1,12 +1,17 @@
 import spotipy
 from spotipy.oauth2 import SpotifyClientCredentials
 import logging
+import re
 from typing import List, Dict, Optional
 import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 
 from .schemas import SongResponse, AudioFeatures, MoodEnum
 from ..config import Settings
+from ..profiling import span
+from .compact_cache import AudioFeatureStore, TrackStore
+from .resilience import ResilientEndpoint, is_service_failure
 
 logger = logging.getLogger(__name__)
 
@@ -23,18 +28,66 @@ class SpotifyService:
         MoodEnum.NEUTRAL: {"valence": (0.4, 0.6), "energy": (0.4, 0.6)}
     }
 
+    # Maximum ids per call for Spotify's multi-item endpoints
+    TRACKS_BATCH_SIZE = 50
+    AUDIO_FEATURES_BATCH_SIZE = 100
+
+    # Spotify track IDs are 22 base62 characters; anything else fails a whole batch
+    TRACK_ID_PATTERN = re.compile(r"^[0-9A-Za-z]{22}$")
+
+    # Spotify endpoints guarded by a circuit breaker, all idempotent reads
+    ENDPOINTS = ("recommendation_genre_seeds", "recommendations", "audio_features", "track", "tracks")
+
     def __init__(self, settings: Settings):
         """Initialize Spotify client with credentials"""
         credentials = settings.get_spotify_credentials()
         self.client_credentials_manager = SpotifyClientCredentials(
             client_id=credentials["client_id"],
-            client_secret=credentials["client_secret"]
+            client_secret=credentials["client_secret"],
+            requests_timeout=settings.SPOTIFY_REQUEST_TIMEOUT
+        )
+        # Retries are left to hedging and the circuit breakers, so spotipy's are disabled
+        self.sp = spotipy.Spotify(
+            client_credentials_manager=self.client_credentials_manager,
+            requests_timeout=settings.SPOTIFY_REQUEST_TIMEOUT,
+            retries=0,
+            status_retries=0
         )
-        self.sp = spotipy.Spotify(client_credentials_manager=self.client_credentials_manager)
         self.cache = {}
         self.cache_ttl = timedelta(seconds=settings.CACHE_TTL)
         self.max_cache_size = settings.MAX_CACHE_SIZE
 
+        # Per-track entries use compact stores; see services/compact_cache.py.
+        # Feature rows are shared by cached tracks, which pin theirs, and by
+        # recommendation lookups, so the feature store holds room for both
+        self.audio_features_cache = AudioFeatureStore(
+            ttl=settings.CACHE_TTL,
+            max_size=settings.MAX_CACHE_SIZE * 2
+        )
+        self.track_cache = TrackStore(
+            ttl=settings.CACHE_TTL,
+            max_size=settings.MAX_CACHE_SIZE,
+            audio_features=self.audio_features_cache
+        )
+
+        # Blocking Spotify calls get their own threads, apart from audio processing
+        self.executor = ThreadPoolExecutor(
+            max_workers=settings.SPOTIFY_MAX_WORKERS,
+            thread_name_prefix="spotify"
+        )
+        self.endpoints = {
+            name: ResilientEndpoint(
+                name,
+                failure_threshold=settings.SPOTIFY_BREAKER_FAILURE_THRESHOLD,
+                reset_timeout=settings.SPOTIFY_BREAKER_RESET_TIMEOUT,
+                hedge_enabled=settings.SPOTIFY_HEDGE_ENABLED,
+                hedge_min_delay=settings.SPOTIFY_HEDGE_MIN_DELAY,
+                hedge_budget=settings.SPOTIFY_HEDGE_BUDGET,
+                executor=self.executor
+            )
+            for name in self.ENDPOINTS
+        }
+
     def _clean_cache(self):
         """Remove expired cache entries"""
         now = datetime.utcnow()
@@ -49,6 +102,19 @@ class SpotifyService:
             for k, _ in sorted_cache[:to_remove]:
                 del self.cache[k]
 
+    async def _call(self, endpoint: str, *args, hedge: bool = True, **kwargs):
+        """
+        Call a Spotify endpoint through its circuit breaker
+        All endpoints are idempotent reads, so calls are hedged unless
+        hedge=False; multi-item batches opt out so their latencies do not
+        skew the hedge delay of single-item calls
+        """
+        return await self.endpoints[endpoint].call(getattr(self.sp, endpoint), *args, hedge=hedge, **kwargs)
+
+    def get_metrics(self) -> Dict[str, dict]:
+        """Return circuit breaker state and hedge counts per endpoint"""
+        return {name: endpoint.metrics() for name, endpoint in self.endpoints.items()}
+
     def _get_cached(self, key: str) -> Optional[dict]:
         """Get value from cache if not expired"""
         if key in self.cache:
@@ -67,14 +133,18 @@ class SpotifyService:
         }
 
     async def get_audio_features(self, track_id: str) -> Optional[AudioFeatures]:
-        """Get audio features for a track"""
+        """
+        Get audio features for a track
+        Returns None if Spotify has none; CircuitOpenError and server errors are raised
+        """
         try:
-            cache_key = f"audio_features_{track_id}"
-            cached = self._get_cached(cache_key)
+            with span("cache.get"):
+                cached = self.audio_features_cache.get(track_id)
             if cached:
-                return AudioFeatures(**cached)
+                return cached
 
-            features = self.sp.audio_features([track_id])[0]
+            with span("spotify.audio_features"):
+                features = (await self._call("audio_features", [track_id]))[0]
             if not features:
                 return None
 
@@ -86,10 +156,13 @@ class SpotifyService:
                 instrumentalness=features["instrumentalness"]
             )
             
-            self._set_cached(cache_key, audio_features.dict())
+            self.audio_features_cache.set(track_id, audio_features)
             return audio_features
         except Exception as e:
             logger.error(f"Error getting audio features for track {track_id}: {str(e)}")
+            # Let callers fall back while Spotify itself is failing
+            if is_service_failure(e):
+                raise
             return None
 
     def _matches_mood(self, features: Dict[str, float], mood: MoodEnum) -> bool:
@@ -101,32 +174,105 @@ class SpotifyService:
                     return False
         return True
 
+    def _predict_mood(self, features: AudioFeatures) -> Optional[MoodEnum]:
+        """Determine mood based on audio features"""
+        feature_dict = features.dict()
+        for mood in self.MOOD_FEATURES:
+            if self._matches_mood(feature_dict, mood):
+                return mood
+        return None
+
+    def _to_song_response(
+        self,
+        track: dict,
+        features: Optional[AudioFeatures],
+        predicted_mood: Optional[MoodEnum]
+    ) -> SongResponse:
+        """Build a SongResponse from a Spotify track object"""
+        return SongResponse(
+            id=track["id"],
+            name=track["name"],
+            artist=track["artists"][0]["name"],
+            album=track["album"]["name"],
+            preview_url=track["preview_url"],
+            external_url=track["external_urls"]["spotify"],
+            duration_ms=track["duration_ms"],
+            audio_features=features,
+            predicted_mood=predicted_mood
+        )
+
+    async def _fetch_batches(
+        self,
+        endpoint: str,
+        ids: List[str],
+        batch_size: int,
+        key: Optional[str] = None
+    ) -> list:
+        """
+        Call a multi-item endpoint on batches of ids concurrently, preserving order
+        A batch rejected with a client error yields None for each of its ids
+        """
+        async def fetch(batch: List[str]) -> list:
+            try:
+                result = await self._call(endpoint, batch, hedge=False)
+            except spotipy.SpotifyException as e:
+                if is_service_failure(e):
+                    raise
+                logger.warning(f"Spotify rejected {endpoint} batch of {len(batch)} ids: {str(e)}")
+                return [None] * len(batch)
+            return result[key] if key else result
+
+        batches = [ids[i:i + batch_size] for i in range(0, len(ids), batch_size)]
+        results = await asyncio.gather(*(fetch(batch) for batch in batches))
+        return [item for batch in results for item in batch]
+
+    def _local_recommendations(self, mood: MoodEnum, limit: int) -> List[SongResponse]:
+        """Recommend cached tracks whose audio features match the mood"""
+        results = []
+        for track_id in self.audio_features_cache.find(self.MOOD_FEATURES[mood]):
+            track = self.track_cache.get(track_id)
+            if not track:
+                continue
+            track.predicted_mood = mood
+            results.append(track)
+            if len(results) >= limit:
+                break
+        return results
+
     async def get_recommendations(
         self,
         mood: MoodEnum,
         limit: int = 10,
         seed_genres: Optional[List[str]] = None
     ) -> List[SongResponse]:
-        """Get song recommendations based on mood"""
+        """
+        Get song recommendations based on mood
+        If Spotify fails part way, nothing is cached and matching cached tracks are served instead
+        """
         try:
             cache_key = f"recommendations_{mood}_{limit}_{seed_genres}"
-            cached = self._get_cached(cache_key)
+            with span("cache.get"):
+                cached = self._get_cached(cache_key)
             if cached:
-                return [SongResponse(**track) for track in cached]
+                with span("validation.song_response"):
+                    return [SongResponse(**track) for track in cached]
 
             # Get seed genres if not provided
             if not seed_genres:
-                available_genres = self.sp.recommendation_genre_seeds()
+                with span("spotify.recommendation_genre_seeds"):
+                    available_genres = (await self._call("recommendation_genre_seeds"))["genres"]
                 seed_genres = available_genres[:5]  # Spotify allows max 5 seed genres
 
             # Get recommendations with mood-based audio feature targets
             mood_features = self.MOOD_FEATURES[mood]
-            recommendations = self.sp.recommendations(
-                seed_genres=seed_genres,
-                limit=limit * 2,  # Request more tracks to filter
-                target_valence=(mood_features["valence"][0] + mood_features["valence"][1]) / 2,
-                target_energy=(mood_features["energy"][0] + mood_features["energy"][1]) / 2
-            )
+            with span("spotify.recommendations"):
+                recommendations = await self._call(
+                    "recommendations",
+                    seed_genres=seed_genres,
+                    limit=limit * 2,  # Request more tracks to filter
+                    target_valence=(mood_features["valence"][0] + mood_features["valence"][1]) / 2,
+                    target_energy=(mood_features["energy"][0] + mood_features["energy"][1]) / 2
+                )
 
             # Process recommendations
             results = []
@@ -136,18 +282,10 @@ class SpotifyService:
                 if not features or not self._matches_mood(features.dict(), mood):
                     continue
 
-                response = SongResponse(
-                    id=track["id"],
-                    name=track["name"],
-                    artist=track["artists"][0]["name"],
-                    album=track["album"]["name"],
-                    preview_url=track["preview_url"],
-                    external_url=track["external_urls"]["spotify"],
-                    duration_ms=track["duration_ms"],
-                    audio_features=features,
-                    predicted_mood=mood
-                )
-                results.append(response)
+                # Cache each track so it can be served by the fallback below
+                song = self._to_song_response(track, features, self._predict_mood(features))
+                self.track_cache.set(song)
+                results.append(song.copy(update={"predicted_mood": mood}))
                 
                 if len(results) >= limit:
                     break
@@ -157,44 +295,120 @@ class SpotifyService:
 
         except Exception as e:
             logger.error(f"Error getting recommendations: {str(e)}")
+            # Fall back to locally cached tracks while Spotify is unavailable
+            fallback = self._local_recommendations(mood, limit)
+            if fallback:
+                logger.info(f"Serving {len(fallback)} cached tracks for {mood}")
+                return fallback
             raise
 
     async def get_track_info(self, track_id: str) -> Optional[SongResponse]:
-        """Get detailed information about a specific track"""
+        """
+        Get detailed information about a specific track
+        Returns None if the track was not found; a track without audio
+        features is returned with audio_features and predicted_mood unset
+        """
         try:
-            cache_key = f"track_info_{track_id}"
-            cached = self._get_cached(cache_key)
+            with span("cache.get"):
+                cached = self.track_cache.get(track_id)
             if cached:
-                return SongResponse(**cached)
+                return cached
 
-            track = self.sp.track(track_id)
+            with span("spotify.track"):
+                track = await self._call("track", track_id)
             features = await self.get_audio_features(track_id)
 
-            if not track or not features:
+            if not track:
                 return None
 
             # Determine mood based on audio features
-            predicted_mood = None
-            for mood, ranges in self.MOOD_FEATURES.items():
-                if self._matches_mood(features.dict(), mood):
-                    predicted_mood = mood
-                    break
+            predicted_mood = self._predict_mood(features) if features else None
+            response = self._to_song_response(track, features, predicted_mood)
 
-            response = SongResponse(
-                id=track["id"],
-                name=track["name"],
-                artist=track["artists"][0]["name"],
-                album=track["album"]["name"],
-                preview_url=track["preview_url"],
-                external_url=track["external_urls"]["spotify"],
-                duration_ms=track["duration_ms"],
-                audio_features=features,
-                predicted_mood=predicted_mood
-            )
-
-            self._set_cached(cache_key, response.dict())
+            # Only complete entries are cached
+            if features:
+                self.track_cache.set(response)
             return response
 
         except Exception as e:
             logger.error(f"Error getting track info for {track_id}: {str(e)}")
-            return None
\ No newline at end of file
+            return None
+
+    async def get_tracks_info(self, track_ids: List[str]) -> List[Optional[SongResponse]]:
+        """
+        Get detailed information about many tracks
+        Cached tracks are served directly; misses are fetched with the
+        multi-track and multi-audio-features endpoints in concurrent batches
+        Returns results in input order, None for tracks that were not found,
+        with the same handling of tracks without audio features as get_track_info
+        """
+        try:
+            unique_ids = list(dict.fromkeys(track_ids))
+            results: Dict[str, Optional[SongResponse]] = {}
+
+            # Malformed ids would make Spotify reject their whole batch
+            for track_id in unique_ids:
+                if not self.TRACK_ID_PATTERN.match(track_id):
+                    results[track_id] = None
+
+            with span("cache.get"):
+                for track_id in unique_ids:
+                    cached = self.track_cache.get(track_id)
+                    if cached:
+                        results[track_id] = cached
+                cached_features = {
+                    track_id: self.audio_features_cache.get(track_id)
+                    for track_id in unique_ids if track_id not in results
+                }
+
+            missing_tracks = [track_id for track_id in unique_ids if track_id not in results]
+            missing_features = [track_id for track_id in missing_tracks if not cached_features[track_id]]
+
+            if missing_tracks:
+                with span("spotify.tracks_batch"):
+                    tracks, features = await asyncio.gather(
+                        self._fetch_batches(
+                            "tracks",
+                            missing_tracks,
+                            self.TRACKS_BATCH_SIZE,
+                            key="tracks"
+                        ),
+                        self._fetch_batches(
+                            "audio_features",
+                            missing_features,
+                            self.AUDIO_FEATURES_BATCH_SIZE
+                        )
+                    )
+                fetched_features = dict(zip(missing_features, features))
+
+                # Classify all fetched tracks in one pass
+                for track_id, track in zip(missing_tracks, tracks):
+                    if not track:
+                        results[track_id] = None
+                        continue
+
+                    audio_features = cached_features[track_id]
+                    if not audio_features and fetched_features.get(track_id):
+                        raw = fetched_features[track_id]
+                        audio_features = AudioFeatures(
+                            tempo=raw["tempo"],
+                            valence=raw["valence"],
+                            energy=raw["energy"],
+                            danceability=raw["danceability"],
+                            instrumentalness=raw["instrumentalness"]
+                        )
+                        self.audio_features_cache.set(track_id, audio_features)
+
+                    predicted_mood = self._predict_mood(audio_features) if audio_features else None
+                    response = self._to_song_response(track, audio_features, predicted_mood)
+                    results[track_id] = response
+
+                    # Only complete entries are cached
+                    if audio_features:
+                        self.track_cache.set(response)
+
+            return [results[track_id] for track_id in track_ids]
+
+        except Exception as e:
+            logger.error(f"Error getting track info for {len(track_ids)} tracks: {str(e)}")
+            raise
\ No newline at end of file
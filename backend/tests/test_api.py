@@ -78,6 +78,578 @@ async def test_audio_analysis():
     mood = predict_mood(features)
     assert mood in MoodEnum
 
+def test_get_tracks():
+    """Test bulk track lookup endpoint"""
+    test_data = {
+        "track_ids": ["4uLU6hMCjMI75M1A2tKUQC", "7GhIk7Il098yCjg4BQjzvb"]
+    }
+    response = client.post("/tracks", json=test_data)
+    assert response.status_code in [200, 503]  # 503 if Spotify service not initialized
+    if response.status_code == 200:
+        assert [t["id"] for t in response.json()] == test_data["track_ids"]
+
+def test_get_tracks_empty():
+    """Test bulk track lookup rejects an empty id list"""
+    response = client.post("/tracks", json={"track_ids": []})
+    assert response.status_code == 422  # Validation error
+
+class FakeSpotify:
+    """Spotify client stub serving generated tracks"""
+    
+    def __init__(self, unknown=(), without_features=()):
+        self.unknown = set(unknown)
+        self.without_features = set(without_features)
+        self.calls = []
+        self.failing = False
+        self.next_id = 1000
+    
+    def _track(self, track_id):
+        if track_id in self.unknown:
+            return None
+        return {
+            "id": track_id,
+            "name": f"Song {track_id}",
+            "artists": [{"name": "Artist"}],
+            "album": {"name": "Album"},
+            "preview_url": None,
+            "external_urls": {"spotify": f"https://open.spotify.com/track/{track_id}"},
+            "duration_ms": 180000
+        }
+    
+    def _features(self, track_id):
+        if track_id in self.unknown or track_id in self.without_features:
+            return None
+        return {
+            "tempo": 120.0,
+            "valence": 0.8,
+            "energy": 0.7,
+            "danceability": 0.6,
+            "instrumentalness": 0.1
+        }
+    
+    def track(self, track_id):
+        self.calls.append(("track", 1))
+        return self._track(track_id)
+    
+    def tracks(self, track_ids):
+        self.calls.append(("tracks", len(track_ids)))
+        return {"tracks": [self._track(t) for t in track_ids]}
+    
+    def audio_features(self, track_ids):
+        import spotipy
+        
+        self.calls.append(("audio_features", len(track_ids)))
+        if self.failing:
+            raise spotipy.SpotifyException(500, -1, "Server error")
+        return [self._features(t) for t in track_ids]
+    
+    def recommendation_genre_seeds(self):
+        return {"genres": ["pop", "rock"]}
+    
+    def recommendations(self, limit, **kwargs):
+        self.calls.append(("recommendations", limit))
+        ids = range(self.next_id, self.next_id + limit)
+        self.next_id += limit
+        return {"tracks": [self._track(track_id(i)) for i in ids]}
+
+def make_spotify_service(sp):
+    """Create a SpotifyService backed by a stub client"""
+    from ..config import Settings
+    from ..services.spotify_service import SpotifyService
+    
+    service = SpotifyService(Settings(
+        SPOTIFY_CLIENT_ID="client_id",
+        SPOTIFY_CLIENT_SECRET="client_secret",
+        SPOTIFY_REDIRECT_URI="http://example.com/callback"
+    ))
+    service.sp = sp
+    return service
+
+def track_id(i: int) -> str:
+    return f"{i:022d}"
+
+@pytest.mark.asyncio
+async def test_get_tracks_info_batches_and_cache():
+    """Test bulk lookup batching, ordering and partial cache hits"""
+    sp = FakeSpotify(unknown=[track_id(5)])
+    service = make_spotify_service(sp)
+    
+    # Warm the cache with one track
+    assert (await service.get_track_info(track_id(0))).id == track_id(0)
+    sp.calls.clear()
+    
+    ids = [track_id(i) for i in range(121)] + [track_id(3), "not-a-track-id"]
+    results = await service.get_tracks_info(ids)
+    
+    # 120 uncached ids: 3 track batches of up to 50, 2 feature batches of up to 100
+    assert sorted(sp.calls) == sorted([
+        ("tracks", 50), ("tracks", 50), ("tracks", 20),
+        ("audio_features", 100), ("audio_features", 20)
+    ])
+    assert len(results) == len(ids)
+    assert not service.endpoints["tracks"].latencies  # Batches are not hedged
+    assert [r.id if r else None for r in results[:5]] == ids[:5]
+    assert results[-2].id == track_id(3)
+    assert results[5] is None and results[-1] is None
+    assert results[1].predicted_mood == MoodEnum.HAPPY
+    
+    # Everything found is now cached
+    sp.calls.clear()
+    await service.get_tracks_info(ids[:10])
+    assert sp.calls == [("tracks", 1), ("audio_features", 1)]  # Only the unknown id
+
+@pytest.mark.asyncio
+async def test_track_without_features_found_on_both_paths():
+    """Test single and bulk lookups agree on tracks without audio features"""
+    service = make_spotify_service(FakeSpotify(without_features=[track_id(1)]))
+    
+    single = await service.get_track_info(track_id(1))
+    bulk = (await service.get_tracks_info([track_id(1)]))[0]
+    for track in [single, bulk]:
+        assert track.id == track_id(1)
+        assert track.audio_features is None and track.predicted_mood is None
+
+@pytest.mark.asyncio
+async def test_recommendations_fall_back_to_cached_tracks():
+    """Test recommendations are cached per track and served while Spotify fails"""
+    from ..services.resilience import CircuitOpenError
+    
+    sp = FakeSpotify()
+    service = make_spotify_service(sp)
+    assert service.sp is sp
+    
+    recommended = await service.get_recommendations(MoodEnum.HAPPY, limit=2)
+    assert len(recommended) == 2
+    assert all(service.track_cache.get(song.id) for song in recommended)
+    
+    # A failure part way through is not cached and cached tracks are served
+    sp.failing = True
+    fallback = await service.get_recommendations(MoodEnum.HAPPY, limit=3)
+    assert [song.id for song in fallback] == [song.id for song in recommended]
+    assert all(song.predicted_mood == MoodEnum.HAPPY for song in fallback)
+    assert not any(key.endswith("_3_None") for key in service.cache)
+    
+    # With nothing cached the open circuit reaches the caller
+    service = make_spotify_service(sp)
+    for _ in range(service.endpoints["audio_features"].breaker.failure_threshold):
+        service.endpoints["audio_features"].breaker.record_failure()
+    with pytest.raises(CircuitOpenError):
+        await service.get_recommendations(MoodEnum.HAPPY, limit=2)
+
+def test_spotify_client_does_not_retry():
+    """Test spotipy retries are disabled in favour of the circuit breakers"""
+    from ..config import Settings
+    from ..services.spotify_service import SpotifyService
+    
+    settings = Settings(
+        SPOTIFY_CLIENT_ID="client_id",
+        SPOTIFY_CLIENT_SECRET="client_secret",
+        SPOTIFY_REDIRECT_URI="http://example.com/callback",
+        SPOTIFY_REQUEST_TIMEOUT=2.5
+    )
+    sp = SpotifyService(settings).sp
+    assert sp.retries == 0 and sp.status_retries == 0
+    assert sp.requests_timeout == 2.5
+
+def test_get_tracks_marks_missing():
+    """Test bulk endpoint keeps order and marks missing tracks"""
+    from .. import main
+    
+    original = main.spotify_service
+    main.spotify_service = make_spotify_service(FakeSpotify(unknown=[track_id(2)]))
+    try:
+        ids = [track_id(1), track_id(2), "bad id", track_id(1)]
+        response = client.post("/tracks", json={"track_ids": ids})
+    finally:
+        main.spotify_service = original
+    
+    assert response.status_code == 200
+    assert [t["id"] for t in response.json()] == ids
+    assert [t["found"] for t in response.json()] == [True, False, False, True]
+
+def test_streaming_features_match_batch(tmp_path):
+    """Test streaming feature extraction against the batch extractor"""
+    import numpy as np
+    import soundfile as sf
+    import librosa
+    from ..utils import extract_audio_features, StreamingFeatureExtractor
+    
+    if int(librosa.__version__.split(".")[1]) >= 9 or not librosa.__version__.startswith("0."):
+        pytest.skip("Tolerances assume the reflect padding of librosa<0.9")
+    
+    sr = 22050
+    t = np.arange(sr * 10) / sr
+    rng = np.random.RandomState(0)
+    y = 0.3 * np.sin(2 * np.pi * 440 * t) * (1 + np.sign(np.sin(2 * np.pi * 2 * t))) / 2
+    y = (y + 0.05 * rng.randn(len(t))).astype(np.float32)
+    
+    audio_path = str(tmp_path / "test.wav")
+    sf.write(audio_path, y, sr, subtype="FLOAT")
+    batch = extract_audio_features(audio_path, sr=sr)
+    
+    # Feed uneven chunks, as a network stream would
+    extractor = StreamingFeatureExtractor(sr=sr, block_frames=16)
+    position = 0
+    for size in [100, 5000, 1, 30000] * 10 + [len(y)]:
+        extractor.feed(y[position:position + size])
+        position += size
+    streamed = extractor.finalize()
+    
+    assert abs(streamed["tempo"] - batch["tempo"]) < 1e-6
+    for key in ["energy", "valence", "danceability"]:
+        assert abs(streamed[key] - batch[key]) < 1e-3
+    
+    # instrumentalness saturates on this signal, so compare the raw MFCC variance
+    mfcc_var = np.var(librosa.feature.mfcc(y=y, sr=sr))
+    streamed_var = extractor._mfcc_m2 / extractor._mfcc_count
+    assert abs(streamed_var - mfcc_var) / mfcc_var < 1e-4
+
+@pytest.mark.asyncio
+async def test_analyze_song_falls_back_when_stream_decode_fails(monkeypatch):
+    """Test the file-based path is used when the stream cannot be decoded"""
+    from .. import utils
+    
+    features = {
+        "tempo": 120.0,
+        "valence": 0.8,
+        "energy": 0.7,
+        "danceability": 0.6,
+        "instrumentalness": 0.1
+    }
+    
+    async def stream_fails(url, sr, max_size_mb):
+        return None
+    
+    async def download(url, max_size_mb):
+        return "song.m4a"
+    
+    monkeypatch.setattr(utils.shutil, "which", lambda name: "/usr/bin/ffmpeg")
+    monkeypatch.setattr(utils, "stream_audio_features", stream_fails)
+    monkeypatch.setattr(utils, "download_audio", download)
+    monkeypatch.setattr(utils, "extract_audio_features", lambda path, sr: features)
+    
+    result = await utils.analyze_song_features("https://example.com/song.m4a")
+    assert result["tempo"] == 120.0
+    
+    async def stream_rejected(url, sr, max_size_mb):
+        raise utils.AudioDownloadError("File size exceeds maximum allowed size of 10MB")
+    
+    monkeypatch.setattr(utils, "stream_audio_features", stream_rejected)
+    assert await utils.analyze_song_features("https://example.com/song.m4a") is None
+
+@pytest.mark.asyncio
+async def test_download_audio_size_limit():
+    """Test the file-based download enforces the same size limit as streaming"""
+    import os
+    from aiohttp import web
+    from .. import utils
+    
+    async def song(request):
+        return web.Response(body=b"\0" * (1024 * 1024 + 1))
+    
+    app = web.Application()
+    app.router.add_get("/song.mp3", song)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    try:
+        port = site._server.sockets[0].getsockname()[1]
+        url = f"http://127.0.0.1:{port}/song.mp3"
+        assert await utils.download_audio(url, max_size_mb=1) is None
+        path = await utils.download_audio(url, max_size_mb=2)
+        assert os.path.getsize(path) == 1024 * 1024 + 1
+        os.remove(path)
+    finally:
+        await runner.cleanup()
+
+def test_compact_cache():
+    """Test compact audio feature and track stores"""
+    from ..schemas import AudioFeatures, SongResponse
+    from ..services.compact_cache import AudioFeatureStore, TrackStore
+    
+    features = AudioFeatures(
+        tempo=120.0,
+        valence=0.8,
+        energy=0.7,
+        danceability=0.6,
+        instrumentalness=0.1
+    )
+    feature_store = AudioFeatureStore(ttl=3600, max_size=40, initial_capacity=4)
+    track_store = TrackStore(ttl=3600, max_size=20, audio_features=feature_store)
+    
+    for i in range(25):
+        track_store.set(SongResponse(
+            id=f"track{i}",
+            name=f"Song {i}",
+            artist="Artist",
+            album="Album",
+            external_url=f"https://open.spotify.com/track/track{i}",
+            duration_ms=180000,
+            audio_features=features,
+            predicted_mood=MoodEnum.HAPPY
+        ))
+    
+    # Oldest entries are evicted once full
+    assert len(track_store) <= 20
+    assert track_store.get("track0") is None
+    
+    song = track_store.get("track24")
+    assert song.external_url == "https://open.spotify.com/track/track24"
+    assert song.predicted_mood == MoodEnum.HAPPY
+    assert abs(song.audio_features.valence - 0.8) < 1e-6
+    
+    # Feature-only entries do not evict features of cached tracks
+    cached_tracks = len(track_store)
+    for i in range(100):
+        feature_store.set(f"feature{i}", features)
+    assert len(feature_store) <= 40
+    assert all(track_store.get(f"track{i}") for i in range(25 - cached_tracks, 25))
+    
+    expired_store = AudioFeatureStore(ttl=-1, max_size=10)
+    expired_store.set("track", features)
+    assert expired_store.get("track") is None
+
+def test_mood_smoother_hysteresis():
+    """Test mood smoother only switches after a sustained lead"""
+    from ..schemas import MoodFrame
+    from ..services.mood_session import MoodSmoother
+    
+    smoother = MoodSmoother(alpha=0.5, margin=0.1, min_dwell_frames=2)
+    assert smoother.update(MoodFrame(mood=MoodEnum.HAPPY)) == MoodEnum.HAPPY
+    
+    # A single flickering frame does not change the mood
+    assert smoother.update(MoodFrame(mood=MoodEnum.SAD)) is None
+    assert smoother.update(MoodFrame(mood=MoodEnum.HAPPY)) is None
+    
+    # A sustained change does
+    changes = [smoother.update(MoodFrame(mood=MoodEnum.SAD)) for _ in range(5)]
+    assert changes.count(MoodEnum.SAD) == 1
+    assert smoother.current == MoodEnum.SAD
+
+def test_mood_smoother_scores():
+    """Test mood smoother accepts per-frame scores"""
+    from ..schemas import MoodFrame
+    from ..services.mood_session import MoodSmoother
+    
+    smoother = MoodSmoother()
+    frame = MoodFrame(scores={"calm": 0.6, "neutral": 0.4})
+    assert smoother.update(frame) == MoodEnum.CALM
+    assert smoother.update(frame) is None
+    
+    with pytest.raises(ValueError):
+        smoother.update(MoodFrame())
+
+def test_mood_session_invalid_frame():
+    """Test mood session replies to frames that are not valid JSON text"""
+    from .. import main
+    
+    class StubSpotifyService:
+        async def get_recommendations(self, mood, limit):
+            return []
+    
+    original = main.spotify_service
+    main.spotify_service = StubSpotifyService()
+    try:
+        with client.websocket_connect("/ws/mood_session") as websocket:
+            websocket.send_text("not json")
+            assert "Invalid frame" in websocket.receive_json()["detail"]
+            websocket.send_bytes(b'{"mood": "happy"}')
+            assert "Invalid frame" in websocket.receive_json()["detail"]
+            websocket.send_json({"mood": "happy"})
+            assert websocket.receive_json()["mood"] == "happy"
+    finally:
+        main.spotify_service = original
+
+def test_mood_session_websocket():
+    """Test mood session websocket endpoint"""
+    with client.websocket_connect("/ws/mood_session") as websocket:
+        data = websocket.receive_json()
+        assert "detail" in data  # Spotify service not initialized outside of startup
+
+def test_profiling_spans():
+    """Test spans are recorded only while a profile is active"""
+    from ..profiling import span, start_profile, finish_profile, SlowRequestLog
+    
+    with span("ignored"):
+        pass
+    
+    log = SlowRequestLog(max_size=2)
+    for path in ["/a", "/b", "/c"]:
+        profile = start_profile("GET", path)
+        with span("work"):
+            pass
+        finish_profile(profile, 200)
+        log.record(profile)
+    
+    slowest = log.slowest(limit=5)
+    assert len(slowest) == 2  # Fastest profile evicted
+    assert all(p["spans"][0]["name"] == "work" for p in slowest)
+    assert slowest[0]["duration_ms"] >= slowest[1]["duration_ms"]
+    
+    # Spans after the request finished are not recorded
+    with span("after"):
+        pass
+    assert len(profile.spans) == 1
+
+def test_slow_request_log_keeps_slowest():
+    """Test fast and stale profiles do not displace the slowest recent ones"""
+    from ..profiling import RequestProfile, SlowRequestLog
+    
+    log = SlowRequestLog(max_size=3, max_age=60)
+    stale = RequestProfile("GET", "/recommendations")
+    stale.start -= 120
+    stale.duration = 10.0
+    log.record(stale)
+    
+    for duration in [5.0, 1.0, 4.0, 3.0] + [0.1] * 10:
+        profile = RequestProfile("GET", "/recommendations")
+        profile.duration = duration
+        log.record(profile)
+    
+    assert [p["duration_ms"] for p in log.slowest()] == [5000.0, 4000.0, 3000.0]
+
+def test_should_profile_skips_health_and_admin():
+    """Test health checks and admin endpoints are never profiled"""
+    from .. import main
+    
+    headers = [(b"x-profile", b"1"), (b"x-api-key", b"k")]
+    for path, expected in [("/recommendations", True), ("/health", False), ("/admin/slow_requests", False)]:
+        scope = {"type": "http", "method": "GET", "path": path, "headers": headers}
+        assert main.should_profile(scope) == (expected and main.settings.API_KEY is not None)
+
+@pytest.mark.asyncio
+async def test_profiling_middleware():
+    """Test profiling middleware only wraps selected requests"""
+    from ..profiling import ProfilingMiddleware, SlowRequestLog, span
+    
+    async def app(scope, receive, send):
+        with span("handler"):
+            await send({"type": "http.response.start", "status": 200, "headers": []})
+            await send({"type": "http.response.body", "body": b""})
+    
+    async def run(middleware):
+        messages = []
+        async def send(message):
+            messages.append(message)
+        scope = {"type": "http", "method": "GET", "path": "/health", "headers": []}
+        await middleware(scope, None, send)
+        return dict(messages[0]["headers"])
+    
+    log = SlowRequestLog()
+    headers = await run(ProfilingMiddleware(app, log=log, should_profile=lambda scope: False))
+    assert b"x-profile-id" not in headers
+    assert len(log.profiles) == 0
+    
+    headers = await run(ProfilingMiddleware(app, log=log, should_profile=lambda scope: True))
+    profile = log.slowest()[0]
+    assert headers[b"x-profile-id"] == str(profile["id"]).encode()
+    assert profile["status_code"] == 200
+    assert [s["name"] for s in profile["spans"]] == ["handler"]
+
+def test_slow_requests_requires_api_key():
+    """Test admin endpoint rejects requests without an API key"""
+    response = client.get("/admin/slow_requests")
+    assert response.status_code == 403
+
+def test_circuit_breaker():
+    """Test circuit breaker opens after failures and recovers"""
+    from ..services.resilience import CircuitBreaker
+    
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0)
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    
+    # A single trial call is let through once the timeout has passed
+    assert breaker.allow()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+@pytest.mark.asyncio
+async def test_resilient_endpoint():
+    """Test hedged calls and fail-fast behaviour"""
+    import time
+    from ..services.resilience import ResilientEndpoint, CircuitOpenError
+    
+    endpoint = ResilientEndpoint(
+        "test",
+        failure_threshold=1,
+        hedge_min_samples=5,
+        hedge_min_delay=0.01,
+        hedge_budget=1.0
+    )
+    for _ in range(5):
+        await endpoint.call(time.sleep, 0.01, hedge=True)
+    
+    # A slow first attempt is overtaken by the hedged duplicate
+    attempts = []
+    def slow_first():
+        attempts.append(None)
+        if len(attempts) == 1:
+            time.sleep(0.5)
+        return len(attempts)
+    assert await endpoint.call(slow_first, hedge=True) == 2
+    assert endpoint.hedges == 1 and endpoint.hedge_wins == 1
+    
+    # Calls are not hedged unless asked to be
+    attempts.clear()
+    assert await endpoint.call(slow_first) == 1
+    assert endpoint.hedges == 1
+    
+    def fail():
+        raise ConnectionError("Spotify unavailable")
+    with pytest.raises(ConnectionError):
+        await endpoint.call(fail)
+    with pytest.raises(CircuitOpenError):
+        await endpoint.call(fail)
+    assert endpoint.metrics()["state"] == "open"
+
+@pytest.mark.asyncio
+async def test_hedge_budget():
+    """Test hedges are capped to a fraction of calls"""
+    import time
+    from ..services.resilience import ResilientEndpoint
+    
+    endpoint = ResilientEndpoint("test", hedge_min_delay=0.01, hedge_budget=0.25, latency_window=400)
+    for _ in range(200):
+        await endpoint.call(lambda: None, hedge=True)
+    
+    # Every call is slower than the hedge delay, but only a quarter are hedged
+    for _ in range(8):
+        await endpoint.call(time.sleep, 0.05, hedge=True)
+    assert endpoint.hedges == 2
+
+@pytest.mark.asyncio
+async def test_cancelled_trial_call_reopens_breaker():
+    """Test a cancelled half-open trial call does not leave the breaker stuck"""
+    import asyncio
+    import time
+    from ..services.resilience import CircuitBreaker, ResilientEndpoint
+    
+    endpoint = ResilientEndpoint("test", failure_threshold=1, reset_timeout=0)
+    endpoint.breaker.record_failure()
+    
+    trial = asyncio.ensure_future(endpoint.call(time.sleep, 0.2))
+    await asyncio.sleep(0.05)
+    assert endpoint.breaker.state == CircuitBreaker.HALF_OPEN
+    trial.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await trial
+    assert endpoint.breaker.state == CircuitBreaker.OPEN
+    
+    # The next call past the reset timeout is let through as a new trial
+    assert await endpoint.call(lambda: "ok") == "ok"
+    assert endpoint.breaker.state == CircuitBreaker.CLOSED
+
+def test_metrics_requires_api_key():
+    """Test metrics endpoint rejects requests without an API key"""
+    response = client.get("/admin/metrics")
+    assert response.status_code == 403
+
 def test_error_handling():
     """Test error handling middleware"""
     response = client.get("/nonexistent_endpoint")
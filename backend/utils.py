@@ -5,17 +5,25 @@ from typing import Dict, Optional, Tuple
 import aiohttp
 import tempfile
 import os
+import shutil
+import asyncio
 from datetime import datetime
 
 from schemas import AudioFeatures, MoodEnum
+from profiling import span
 
 logger = logging.getLogger(__name__)
 
-async def download_audio(url: str) -> Optional[str]:
+class AudioDownloadError(Exception):
+    """Raised when audio cannot be downloaded, as opposed to decoded"""
+
+async def download_audio(url: str, max_size_mb: int = 10) -> Optional[str]:
     """
     Download audio file from URL to temporary file
-    Returns path to temporary file if successful, None otherwise
+    Returns path to temporary file if successful, None otherwise, including
+    when the file is larger than max_size_mb
     """
+    temp_path = None
     try:
         async with aiohttp.ClientSession() as session:
             async with session.get(url) as response:
@@ -27,19 +35,65 @@ async def download_audio(url: str) -> Optional[str]:
                 temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.mp3')
                 temp_path = temp_file.name
                 
-                # Write content to temporary file
+                # Write content to temporary file, enforcing the same limit as streaming
+                max_bytes = max_size_mb * 1024 * 1024
+                received = 0
                 with open(temp_path, 'wb') as f:
                     while True:
                         chunk = await response.content.read(8192)
                         if not chunk:
                             break
+                        received += len(chunk)
+                        if received > max_bytes:
+                            raise AudioDownloadError(f"File size exceeds maximum allowed size of {max_size_mb}MB")
                         f.write(chunk)
                 
                 return temp_path
     except Exception as e:
         logger.error(f"Error downloading audio: {str(e)}")
+        if temp_path and os.path.exists(temp_path):
+            os.remove(temp_path)
         return None
 
+def summarize_audio_features(
+    tempo: float,
+    rms_mean: float,
+    centroid_mean: float,
+    rolloff_mean: float,
+    pulse_mean: float,
+    mfcc_var: float,
+    sr: int
+) -> Dict[str, float]:
+    """
+    Derive the normalized feature set from frame-level statistics
+    Shared by the batch and streaming extractors so both produce the same features
+    """
+    # Normalize energy to 0-1 range
+    energy = min(rms_mean / 0.2, 1.0)  # 0.2 is a reasonable maximum energy value
+    
+    # Calculate "valence" (musical positiveness) using spectral features
+    # This is a simplified approximation
+    valence = np.mean([
+        centroid_mean / (sr/2),  # Normalize by Nyquist frequency
+        rolloff_mean / (sr/2)
+    ])
+    valence = min(valence, 1.0)
+    
+    # Calculate danceability using tempo and rhythm regularity
+    tempo_normalized = min(tempo / 200.0, 1.0)  # Normalize tempo (assuming max 200 BPM)
+    danceability = np.mean([tempo_normalized, pulse_mean])
+    
+    # Calculate instrumentalness using MFCC variance
+    instrumentalness = min(mfcc_var / 100.0, 1.0)  # Normalize variance
+    
+    return {
+        "tempo": float(tempo),
+        "valence": float(valence),
+        "energy": float(energy),
+        "danceability": float(danceability),
+        "instrumentalness": float(instrumentalness)
+    }
+
 def extract_audio_features(audio_path: str, sr: int = 22050) -> Optional[Dict[str, float]]:
     """
     Extract audio features from file using librosa
@@ -57,37 +111,24 @@ def extract_audio_features(audio_path: str, sr: int = 22050) -> Optional[Dict[st
         spectral_rolloff = librosa.feature.spectral_rolloff(y=y, sr=sr)[0]
         
         # Energy
-        energy = np.mean(librosa.feature.rms(y=y)[0])
-        
-        # Normalize energy to 0-1 range
-        energy = min(energy / 0.2, 1.0)  # 0.2 is a reasonable maximum energy value
-        
-        # Calculate "valence" (musical positiveness) using spectral features
-        # This is a simplified approximation
-        valence = np.mean([
-            np.mean(spectral_centroids) / (sr/2),  # Normalize by Nyquist frequency
-            np.mean(spectral_rolloff) / (sr/2)
-        ])
-        valence = min(valence, 1.0)
+        rms = librosa.feature.rms(y=y)[0]
         
-        # Calculate danceability using tempo and rhythm regularity
-        tempo_normalized = min(tempo / 200.0, 1.0)  # Normalize tempo (assuming max 200 BPM)
+        # Rhythm regularity
         onset_env = librosa.onset.onset_strength(y=y, sr=sr)
         pulse = librosa.beat.plp(onset_envelope=onset_env, sr=sr)
-        rhythm_regularity = np.mean(pulse)
-        danceability = np.mean([tempo_normalized, rhythm_regularity])
         
-        # Calculate instrumentalness using MFCC variance
+        # Timbre
         mfccs = librosa.feature.mfcc(y=y, sr=sr)
-        instrumentalness = min(np.var(mfccs) / 100.0, 1.0)  # Normalize variance
         
-        return {
-            "tempo": float(tempo),
-            "valence": float(valence),
-            "energy": float(energy),
-            "danceability": float(danceability),
-            "instrumentalness": float(instrumentalness)
-        }
+        return summarize_audio_features(
+            tempo=tempo,
+            rms_mean=np.mean(rms),
+            centroid_mean=np.mean(spectral_centroids),
+            rolloff_mean=np.mean(spectral_rolloff),
+            pulse_mean=np.mean(pulse),
+            mfcc_var=np.var(mfccs),
+            sr=sr
+        )
     except Exception as e:
         logger.error(f"Error extracting audio features: {str(e)}")
         return None
@@ -98,6 +139,230 @@ def extract_audio_features(audio_path: str, sr: int = 22050) -> Optional[Dict[st
         except:
             pass
 
+class StreamingFeatureExtractor:
+    """
+    Incremental audio feature extractor fed with blocks of decoded samples
+    
+    Frames are laid out exactly like the centered librosa defaults used by
+    extract_audio_features (n_fft=2048, hop_length=512, reflect padding), and
+    each block only updates running sums, so working memory is bounded by the
+    block size. The onset envelopes (one float per hop each) are the only
+    per-track state, since tempo and PLP need the whole envelope.
+    
+    Final features match the batch extractor to within:
+    - tempo: identical when decoding yields identical samples
+    - energy, valence, danceability: 1e-3 absolute
+    - instrumentalness: 1e-2 absolute
+    Residual differences come from the dB floor (top_db) in the batch
+    extractor being relative to the whole-track maximum rather than the
+    running maximum, which affects only near-silent frames before the loudest
+    passage, and from ffmpeg resampling instead of resampy.
+    These tolerances hold for the pinned librosa<0.9, whose centered frames
+    use reflect padding; later releases pad with zeros by default, which
+    changes the edge frames of the batch extractor.
+    """
+
+    def __init__(self, sr: int = 22050, n_fft: int = 2048, hop_length: int = 512, block_frames: int = 256):
+        self.sr = sr
+        self.n_fft = n_fft
+        self.hop_length = hop_length
+        self.block_frames = block_frames
+        self._pad = n_fft // 2
+        self._buffer = np.zeros(0, dtype=np.float32)
+        self._started = False
+        self._n_frames = 0
+        self._rms_sum = 0.0
+        self._centroid_sum = 0.0
+        self._rolloff_sum = 0.0
+        self._mfcc_count = 0
+        self._mfcc_mean = 0.0
+        self._mfcc_m2 = 0.0
+        self._last_mel_db = None
+        self._max_mel_db = -np.inf
+        # Leading zeros match the lag and centering offset of librosa.onset.onset_strength
+        # beat_track aggregates mel bands with the median, plp with the mean
+        self._onset_env = [0.0] * (1 + n_fft // (2 * hop_length))
+        self._beat_env = [0.0] * (1 + n_fft // (2 * hop_length))
+
+    def feed(self, samples: np.ndarray):
+        """Add a block of mono float samples and process all complete frames"""
+        self._buffer = np.concatenate([self._buffer, samples.astype(np.float32, copy=False)])
+        if not self._started:
+            if len(self._buffer) <= self._pad:
+                return
+            # Reflect-pad the start of the signal like a centered STFT
+            self._buffer = np.concatenate([self._buffer[self._pad:0:-1], self._buffer])
+            self._started = True
+        self._process(self.block_frames)
+
+    def _process(self, min_frames: int):
+        """Process complete frames in the buffer if at least min_frames are available"""
+        if len(self._buffer) < self.n_fft:
+            return
+        n_frames = 1 + (len(self._buffer) - self.n_fft) // self.hop_length
+        if n_frames < min_frames:
+            return
+
+        segment = self._buffer[:self.n_fft + (n_frames - 1) * self.hop_length]
+        self._update(segment)
+        self._buffer = self._buffer[n_frames * self.hop_length:]
+
+    def _update(self, segment: np.ndarray):
+        """Update the running statistics with the frames of a segment"""
+        frames = librosa.util.frame(segment, frame_length=self.n_fft, hop_length=self.hop_length)
+        rms = np.sqrt(np.mean(np.abs(frames) ** 2, axis=0))
+
+        S = np.abs(librosa.stft(segment, n_fft=self.n_fft, hop_length=self.hop_length, center=False))
+        centroids = librosa.feature.spectral_centroid(S=S, sr=self.sr, n_fft=self.n_fft)[0]
+        rolloff = librosa.feature.spectral_rolloff(S=S, sr=self.sr, n_fft=self.n_fft)[0]
+
+        mel = librosa.feature.melspectrogram(S=S ** 2, sr=self.sr, n_fft=self.n_fft)
+        mel_db = librosa.power_to_db(mel, top_db=None)
+
+        # The batch extractor floors dB values at top_db below the track maximum;
+        # the running maximum is the closest bound available while streaming
+        self._max_mel_db = max(self._max_mel_db, float(np.max(mel_db)))
+        mel_db = np.maximum(mel_db, self._max_mel_db - 80.0)
+
+        # Onset strength: positive log-mel flux against the previous frame
+        previous = mel_db[:, :1] if self._last_mel_db is None else self._last_mel_db
+        flux = np.maximum(0.0, np.diff(np.hstack([previous, mel_db]), axis=1))
+        if self._last_mel_db is None:
+            flux = flux[:, 1:]
+        self._onset_env.extend(np.mean(flux, axis=0).tolist())
+        self._beat_env.extend(np.median(flux, axis=0).tolist())
+        self._last_mel_db = mel_db[:, -1:]
+
+        # Merge MFCC mean/variance with the running totals (Chan et al.)
+        mfccs = librosa.feature.mfcc(S=mel_db, sr=self.sr)
+        count = mfccs.size
+        mean = float(np.mean(mfccs))
+        m2 = float(np.var(mfccs)) * count
+        total = self._mfcc_count + count
+        delta = mean - self._mfcc_mean
+        self._mfcc_mean += delta * count / total
+        self._mfcc_m2 += m2 + delta ** 2 * self._mfcc_count * count / total
+        self._mfcc_count = total
+
+        self._n_frames += frames.shape[1]
+        self._rms_sum += float(np.sum(rms))
+        self._centroid_sum += float(np.sum(centroids))
+        self._rolloff_sum += float(np.sum(rolloff))
+
+    def finalize(self) -> Dict[str, float]:
+        """Flush the remaining samples and return the summarized features"""
+        if not self._started or len(self._buffer) <= self._pad:
+            raise ValueError("Audio too short to extract features")
+
+        # Reflect-pad the end of the signal like a centered STFT
+        self._buffer = np.concatenate([self._buffer, self._buffer[-2:-self._pad - 2:-1]])
+        self._process(1)
+
+        onset_env = np.array(self._onset_env[:self._n_frames])
+        beat_env = np.array(self._beat_env[:self._n_frames])
+        tempo, _ = librosa.beat.beat_track(onset_envelope=beat_env, sr=self.sr, hop_length=self.hop_length)
+        pulse = librosa.beat.plp(onset_envelope=onset_env, sr=self.sr, hop_length=self.hop_length)
+
+        return summarize_audio_features(
+            tempo=tempo,
+            rms_mean=self._rms_sum / self._n_frames,
+            centroid_mean=self._centroid_sum / self._n_frames,
+            rolloff_mean=self._rolloff_sum / self._n_frames,
+            pulse_mean=np.mean(pulse),
+            mfcc_var=self._mfcc_m2 / self._mfcc_count,
+            sr=self.sr
+        )
+
+async def stream_audio_features(
+    url: str,
+    sr: int = 22050,
+    max_size_mb: int = 10,
+    chunk_size: int = 8192
+) -> Optional[Dict[str, float]]:
+    """
+    Download, decode and extract features in one pipeline
+    Bytes are piped into ffmpeg as they arrive and decoded PCM blocks are fed
+    to a StreamingFeatureExtractor, so feature computation overlaps the transfer
+    Returns dictionary of features if successful, None if decoding failed
+    Raises AudioDownloadError on HTTP errors or when the size limit is exceeded
+    """
+    process = None
+    try:
+        process = await asyncio.create_subprocess_exec(
+            "ffmpeg", "-hide_banner", "-loglevel", "error",
+            "-i", "pipe:0",
+            "-f", "f32le", "-ac", "1", "-ar", str(sr),
+            "pipe:1",
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL
+        )
+        extractor = StreamingFeatureExtractor(sr=sr)
+        loop = asyncio.get_event_loop()
+        max_bytes = max_size_mb * 1024 * 1024
+
+        async def write_audio():
+            try:
+                async with aiohttp.ClientSession() as session:
+                    async with session.get(url) as response:
+                        if response.status != 200:
+                            raise AudioDownloadError(f"Failed to download audio: HTTP {response.status}")
+                        received = 0
+                        while True:
+                            chunk = await response.content.read(chunk_size)
+                            if not chunk:
+                                break
+                            received += len(chunk)
+                            if received > max_bytes:
+                                raise AudioDownloadError(f"File size exceeds maximum allowed size of {max_size_mb}MB")
+                            process.stdin.write(chunk)
+                            await process.stdin.drain()
+            except aiohttp.ClientError as e:
+                raise AudioDownloadError(f"Failed to download audio: {str(e)}")
+            except (BrokenPipeError, ConnectionResetError):
+                # ffmpeg gave up on the input; its exit code reports the decode failure
+                pass
+            finally:
+                process.stdin.close()
+
+        async def read_samples():
+            # Each read is a block of float32 samples; keep partial samples for the next read
+            block_bytes = extractor.block_frames * extractor.hop_length * 4
+            leftover = b""
+            while True:
+                data = await process.stdout.read(block_bytes)
+                if not data:
+                    break
+                data = leftover + data
+                usable = len(data) - len(data) % 4
+                leftover = data[usable:]
+                samples = np.frombuffer(data[:usable], dtype=np.float32)
+                await loop.run_in_executor(None, extractor.feed, samples)
+
+        tasks = [asyncio.ensure_future(write_audio()), asyncio.ensure_future(read_samples())]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            # Do not leave the other stage running when one of them fails
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        if await process.wait() != 0:
+            raise ValueError(f"ffmpeg exited with code {process.returncode}")
+
+        with span("audio.finalize_features"):
+            return await loop.run_in_executor(None, extractor.finalize)
+    except AudioDownloadError:
+        raise
+    except Exception as e:
+        logger.error(f"Error streaming audio features: {str(e)}")
+        return None
+    finally:
+        if process and process.returncode is None:
+            process.kill()
+            await process.wait()
+
 def predict_mood(features: AudioFeatures) -> Optional[MoodEnum]:
     """
     Predict mood based on audio features
@@ -126,24 +391,39 @@ def predict_mood(features: AudioFeatures) -> Optional[MoodEnum]:
         logger.error(f"Error predicting mood: {str(e)}")
         return None
 
-async def analyze_song_features(song_url: str) -> Optional[Dict[str, float]]:
+async def analyze_song_features(
+    song_url: str,
+    sr: int = 22050,
+    max_size_mb: int = 10
+) -> Optional[Dict[str, float]]:
     """
     Analyze song features from URL
     Downloads song, extracts features, and predicts mood
+    Uses the streaming pipeline when ffmpeg is available, falling back to
+    downloading the whole file when the stream cannot be decoded (e.g. MP4
+    files whose index is at the end)
     """
     try:
-        # Download audio file
-        temp_path = await download_audio(song_url)
-        if not temp_path:
-            return None
-            
-        # Extract features
-        features = extract_audio_features(temp_path)
+        features = None
+        if shutil.which("ffmpeg"):
+            with span("audio.stream_features"):
+                features = await stream_audio_features(song_url, sr=sr, max_size_mb=max_size_mb)
+        if not features:
+            # Download audio file
+            with span("audio.download"):
+                temp_path = await download_audio(song_url, max_size_mb=max_size_mb)
+            if not temp_path:
+                return None
+                
+            # Extract features
+            with span("audio.extract_features"):
+                features = extract_audio_features(temp_path, sr=sr)
         if not features:
             return None
             
         # Create AudioFeatures object
-        audio_features = AudioFeatures(**features)
+        with span("validation.audio_features"):
+            audio_features = AudioFeatures(**features)
         
         # Predict mood
         mood = predict_mood(audio_features)